@@ -0,0 +1,251 @@
+"""SQLite store for client profiles, dated portfolio snapshots and cached derived values"""
+import sqlite3
+import json
+import hashlib
+from datetime import datetime
+
+ASSET_CLASSES = ['Stocks', 'Bonds', 'Real Estate', 'Cash', 'Commodities', 'Crypto']
+PROFILE_FIELDS = ['age', 'risk_tolerance', 'investment_goal', 'current_savings',
+                  'monthly_income', 'monthly_expenses', 'monthly_investment']
+DEFAULT_PROFILE = {
+    'age': 35,
+    'risk_tolerance': 'Conservative',
+    'investment_goal': 'Retirement',
+    'current_savings': 50000,
+    'monthly_income': 5000,
+    'monthly_expenses': 3500,
+    'monthly_investment': 500
+}
+DEFAULT_PORTFOLIO = {
+    'Stocks': 45000,
+    'Bonds': 18000,
+    'Real Estate': 9000,
+    'Cash': 3000,
+    'Commodities': 0,
+    'Crypto': 0
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS clients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        age INTEGER NOT NULL,
+        risk_tolerance TEXT NOT NULL,
+        investment_goal TEXT NOT NULL,
+        current_savings NUMERIC NOT NULL,
+        monthly_income NUMERIC NOT NULL,
+        monthly_expenses NUMERIC NOT NULL,
+        monthly_investment NUMERIC NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        snapshot_date TEXT NOT NULL,
+        total_value NUMERIC NOT NULL DEFAULT 0,
+        UNIQUE (client_id, snapshot_date)
+    );
+    -- Only holdings that changed since the previous snapshot are stored
+    CREATE TABLE IF NOT EXISTS holding_changes (
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        snapshot_date TEXT NOT NULL,
+        asset TEXT NOT NULL,
+        value NUMERIC NOT NULL,
+        PRIMARY KEY (client_id, asset, snapshot_date)
+    );
+    -- Used to rewrite and list a single snapshot's changes
+    CREATE INDEX IF NOT EXISTS idx_holding_changes_date
+        ON holding_changes (client_id, snapshot_date);
+    -- Values derived from the (undated) client profile
+    CREATE TABLE IF NOT EXISTS profile_cache (
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (client_id, name)
+    );
+    -- Values derived from a snapshot's holdings
+    CREATE TABLE IF NOT EXISTS snapshot_cache (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (snapshot_id, name)
+    );
+"""
+
+def get_connection(db_path):
+    """Open a connection to the client store, creating the tables if needed"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.executescript(SCHEMA)
+    return conn
+
+def list_clients(conn):
+    """Return all stored clients as (id, name) pairs"""
+    return [(row['id'], row['name']) for row in conn.execute('SELECT id, name FROM clients ORDER BY name')]
+
+def create_client(conn, name, profile, portfolio_data, snapshot_date):
+    """Create a client with an initial portfolio snapshot"""
+    cursor = conn.execute(
+        f"INSERT INTO clients (name, {', '.join(PROFILE_FIELDS)}, updated_at) "
+        f"VALUES (?, {', '.join('?' * len(PROFILE_FIELDS))}, ?)",
+        [name] + [profile[field] for field in PROFILE_FIELDS] + [datetime.now().isoformat()]
+    )
+    client_id = cursor.lastrowid
+    save_portfolio_snapshot(conn, client_id, snapshot_date, portfolio_data)
+    return client_id
+
+def load_client_profile(conn, client_id):
+    """Load a client's profile fields"""
+    row = conn.execute(f"SELECT {', '.join(PROFILE_FIELDS)} FROM clients WHERE id = ?", (client_id,)).fetchone()
+    return {field: row[field] for field in PROFILE_FIELDS}
+
+def save_client_profile(conn, client_id, profile):
+    """Update a client's profile fields"""
+    conn.execute(
+        f"UPDATE clients SET {', '.join(f'{field} = ?' for field in PROFILE_FIELDS)}, updated_at = ? WHERE id = ?",
+        [profile[field] for field in PROFILE_FIELDS] + [datetime.now().isoformat(), client_id]
+    )
+    conn.commit()
+
+def list_snapshot_dates(conn, client_id):
+    """Return a client's snapshot dates, latest first"""
+    return [row['snapshot_date'] for row in conn.execute(
+        'SELECT snapshot_date FROM snapshots WHERE client_id = ? ORDER BY snapshot_date DESC', (client_id,)
+    )]
+
+def get_snapshot_id(conn, client_id, snapshot_date):
+    """Return the id of a client's snapshot for a date, or None"""
+    row = conn.execute('SELECT id FROM snapshots WHERE client_id = ? AND snapshot_date = ?',
+                       (client_id, snapshot_date)).fetchone()
+    return row['id'] if row else None
+
+def _latest_value(conn, client_id, asset, snapshot_date, inclusive=True):
+    """Return an asset's most recent recorded value as of a date, or None"""
+    # A single primary key seek, so the cost doesn't grow with the length of the history
+    operator = '<=' if inclusive else '<'
+    row = conn.execute(
+        f"SELECT value FROM holding_changes WHERE client_id = ? AND asset = ? AND snapshot_date {operator} ? "
+        f"ORDER BY snapshot_date DESC LIMIT 1",
+        (client_id, asset, snapshot_date)
+    ).fetchone()
+    return row['value'] if row else None
+
+def _query_holdings(conn, client_id, snapshot_date, inclusive=True):
+    """Resolve the recorded value of each asset as of a date"""
+    holdings = {}
+    for asset in ASSET_CLASSES:
+        value = _latest_value(conn, client_id, asset, snapshot_date, inclusive)
+        if value is not None:
+            holdings[asset] = value
+    return holdings
+
+def load_portfolio_snapshot(conn, client_id, snapshot_date):
+    """Load a client's portfolio holdings as of a snapshot date"""
+    holdings = _query_holdings(conn, client_id, snapshot_date)
+    return {asset: holdings.get(asset, 0) for asset in ASSET_CLASSES}
+
+def save_portfolio_snapshot(conn, client_id, snapshot_date, portfolio_data):
+    """Store a dated snapshot as the diff against the previous snapshot"""
+    previous = _query_holdings(conn, client_id, snapshot_date, inclusive=False)
+    current = _query_holdings(conn, client_id, snapshot_date)
+    changes = [(client_id, snapshot_date, asset, value)
+               for asset, value in portfolio_data.items() if previous.get(asset) != value]
+
+    # Pin the old value of each edited asset on the next snapshot so later dates keep their holdings
+    next_snapshot = conn.execute(
+        'SELECT snapshot_date FROM snapshots WHERE client_id = ? AND snapshot_date > ? ORDER BY snapshot_date LIMIT 1',
+        (client_id, snapshot_date)
+    ).fetchone()
+    if next_snapshot is not None:
+        conn.executemany(
+            'INSERT OR IGNORE INTO holding_changes (client_id, snapshot_date, asset, value) VALUES (?, ?, ?, ?)',
+            [(client_id, next_snapshot['snapshot_date'], asset, current.get(asset, 0))
+             for asset, value in portfolio_data.items() if current.get(asset, 0) != value]
+        )
+
+    conn.execute('DELETE FROM holding_changes WHERE client_id = ? AND snapshot_date = ?', (client_id, snapshot_date))
+    conn.executemany('INSERT INTO holding_changes (client_id, snapshot_date, asset, value) VALUES (?, ?, ?, ?)', changes)
+
+    # The next recorded change of an asset is redundant if it now matches this snapshot
+    for asset, value in portfolio_data.items():
+        next_change = conn.execute(
+            'SELECT snapshot_date, value FROM holding_changes WHERE client_id = ? AND asset = ? AND snapshot_date > ? '
+            'ORDER BY snapshot_date LIMIT 1',
+            (client_id, asset, snapshot_date)
+        ).fetchone()
+        if next_change is not None and next_change['value'] == value:
+            conn.execute('DELETE FROM holding_changes WHERE client_id = ? AND asset = ? AND snapshot_date = ?',
+                         (client_id, asset, next_change['snapshot_date']))
+
+    # Later snapshots are pinned, so only this snapshot's total can change
+    total_value = sum(_query_holdings(conn, client_id, snapshot_date).values())
+    conn.execute(
+        'INSERT INTO snapshots (client_id, snapshot_date, total_value) VALUES (?, ?, ?) '
+        'ON CONFLICT (client_id, snapshot_date) DO UPDATE SET total_value = excluded.total_value',
+        (client_id, snapshot_date, total_value)
+    )
+    conn.commit()
+    return get_snapshot_id(conn, client_id, snapshot_date)
+
+def load_snapshot_history(conn, client_id):
+    """Return (date, total value) for every snapshot of a client in date order"""
+    return [(row['snapshot_date'], row['total_value']) for row in conn.execute(
+        'SELECT snapshot_date, total_value FROM snapshots WHERE client_id = ? ORDER BY snapshot_date', (client_id,)
+    )]
+
+def load_snapshot_changes(conn, client_id, snapshot_date):
+    """Return (asset, previous value, new value) for each holding changed in a snapshot"""
+    rows = conn.execute('SELECT asset, value FROM holding_changes WHERE client_id = ? AND snapshot_date = ?',
+                        (client_id, snapshot_date)).fetchall()
+    changes = []
+    for row in rows:
+        previous = _latest_value(conn, client_id, row['asset'], snapshot_date, inclusive=False)
+        changes.append((row['asset'], previous if previous is not None else 0, row['value']))
+    return changes
+
+def get_derived_values(conn, client_id, snapshot_id, inputs, dependencies, compute, version):
+    """Return derived values, recomputing only those whose inputs or version changed
+
+    Values depending on 'portfolio' are cached per snapshot; the rest only
+    depend on the client profile and are cached per client. Pass a
+    snapshot_id of None for unsaved holdings to compute them without caching.
+    """
+    profile_cached = {row['name']: row for row in conn.execute(
+        'SELECT name, fingerprint, value FROM profile_cache WHERE client_id = ?', (client_id,)
+    )}
+    snapshot_cached = {row['name']: row for row in conn.execute(
+        'SELECT name, fingerprint, value FROM snapshot_cache WHERE snapshot_id = ?', (snapshot_id,)
+    )}
+
+    derived = {}
+    profile_updates = []
+    snapshot_updates = []
+    for name, fields in dependencies.items():
+        fingerprint = hashlib.sha1(
+            json.dumps([version] + [inputs[field] for field in fields], sort_keys=True).encode()
+        ).hexdigest()
+        per_snapshot = 'portfolio' in fields
+        cached = snapshot_cached if per_snapshot else profile_cached
+
+        if name in cached and cached[name]['fingerprint'] == fingerprint:
+            derived[name] = json.loads(cached[name]['value'])
+        else:
+            derived[name] = compute(name, inputs)
+            if per_snapshot and snapshot_id is None:
+                continue
+            elif per_snapshot:
+                snapshot_updates.append((snapshot_id, name, fingerprint, json.dumps(derived[name])))
+            else:
+                profile_updates.append((client_id, name, fingerprint, json.dumps(derived[name])))
+
+    if profile_updates or snapshot_updates:
+        conn.executemany('INSERT OR REPLACE INTO profile_cache (client_id, name, fingerprint, value) VALUES (?, ?, ?, ?)',
+                         profile_updates)
+        conn.executemany('INSERT OR REPLACE INTO snapshot_cache (snapshot_id, name, fingerprint, value) VALUES (?, ?, ?, ?)',
+                         snapshot_updates)
+        conn.commit()
+
+    return derived
@@ -5,9 +5,16 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import yfinance as yf
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 import warnings
 import io
+import inspect
+import hashlib
+from contextlib import closing
+from client_store import (ASSET_CLASSES, DEFAULT_PROFILE, DEFAULT_PORTFOLIO, get_connection, list_clients,
+                          create_client, load_client_profile, save_client_profile, list_snapshot_dates,
+                          get_snapshot_id, load_portfolio_snapshot, save_portfolio_snapshot,
+                          load_snapshot_history, load_snapshot_changes, get_derived_values)
 warnings.filterwarnings('ignore')
 
 # Page configuration
@@ -100,16 +107,20 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
-if 'portfolio_data' not in st.session_state:
-    st.session_state.portfolio_data = {
-        'Stocks': 45000,
-        'Bonds': 18000,
-        'Real Estate': 9000,
-        'Cash': 3000,
-        'Commodities': 0,
-        'Crypto': 0
-    }
+# Local client profile store
+DB_PATH = 'financial_advisor.db'
+RISK_TOLERANCES = ["Conservative", "Moderate", "Aggressive"]
+INVESTMENT_GOALS = ["Retirement", "Wealth Building", "Income Generation", "Education Fund"]
+# Inputs each cached value depends on; only values whose inputs changed are recomputed
+DERIVED_DEPENDENCIES = {
+    'metrics': ['portfolio'],
+    'savings_rate': ['monthly_income', 'monthly_expenses'],
+    'recommendations': ['risk_tolerance', 'age', 'investment_goal'],
+    'retirement_projection': ['age', 'current_savings', 'monthly_investment'],
+    'projection_series': ['age', 'current_savings', 'monthly_investment'],
+    'scenarios': ['age', 'current_savings', 'monthly_investment'],
+    'retirement_needs': ['monthly_expenses']
+}
 
 # Initialize FAQ data
 if 'faq_data' not in st.session_state:
@@ -278,39 +289,131 @@ def load_faq_from_csv(uploaded_file):
         st.error(f"Error loading CSV file: {str(e)}")
         return None
 
-def main():
+def _compute_derived_value(name, inputs):
+    """Compute a single derived value from the client inputs"""
+    years_to_retirement = max(65 - inputs['age'], 0)
+    
+    if name == 'metrics':
+        return calculate_portfolio_metrics(inputs['portfolio'])
+    elif name == 'savings_rate':
+        monthly_income = inputs['monthly_income']
+        return ((monthly_income - inputs['monthly_expenses']) / monthly_income) * 100 if monthly_income > 0 else 0
+    elif name == 'recommendations':
+        return get_investment_recommendations(inputs['risk_tolerance'], inputs['age'], inputs['investment_goal'])
+    elif name == 'retirement_projection':
+        return calculate_retirement_projection(inputs['current_savings'], inputs['monthly_investment'], years_to_retirement)
+    elif name == 'projection_series':
+        return [calculate_retirement_projection(inputs['current_savings'], inputs['monthly_investment'], year)
+                for year in range(0, years_to_retirement + 1)]
+    elif name == 'scenarios':
+        return {
+            'Conservative (5% return)': calculate_retirement_projection(inputs['current_savings'], inputs['monthly_investment'], years_to_retirement, 0.05),
+            'Moderate (7% return)': calculate_retirement_projection(inputs['current_savings'], inputs['monthly_investment'], years_to_retirement, 0.07),
+            'Aggressive (9% return)': calculate_retirement_projection(inputs['current_savings'], inputs['monthly_investment'], years_to_retirement, 0.09)
+        }
+    else:  # retirement_needs (25x annual expenses rule)
+        return inputs['monthly_expenses'] * 12 * 25
+
+# Cached values are invalidated whenever the calculation code changes (e.g. edited risk_weights)
+DERIVED_VERSION = hashlib.sha1(''.join(inspect.getsource(func) for func in [
+    calculate_portfolio_metrics, calculate_risk_score, get_investment_recommendations,
+    calculate_retirement_projection, _compute_derived_value
+]).encode()).hexdigest()
+
+def render_dashboard(conn):
     st.markdown('<h1 class="main-header">💰 Financial Advisor</h1>', unsafe_allow_html=True)
     st.markdown("### Personalized Investment Analysis & Recommendations")
     
+    # Apply selections requested on the previous run (widget keys can't change once the widget exists)
+    for key in ['client_id', 'snapshot_date']:
+        if f'pending_{key}' in st.session_state:
+            st.session_state[key] = st.session_state.pop(f'pending_{key}')
+    
+    # Client selection
+    st.sidebar.header("🗂️ Client")
+    clients = list_clients(conn)
+    if not clients:
+        create_client(conn, "Default Client", DEFAULT_PROFILE, DEFAULT_PORTFOLIO, date.today().isoformat())
+        clients = list_clients(conn)
+    
+    client_names = {client_id: name for client_id, name in clients}
+    client_id = st.sidebar.selectbox("Select Client", list(client_names), format_func=lambda x: client_names[x],
+                                     key='client_id')
+    
+    with st.sidebar.expander("➕ Add Client"):
+        new_client_name = st.text_input("Client Name")
+        if st.button("Create Client") and new_client_name.strip():
+            if new_client_name.strip() in client_names.values():
+                st.error("A client with this name already exists")
+            else:
+                st.session_state.pending_client_id = create_client(conn, new_client_name.strip(), DEFAULT_PROFILE,
+                                                                   DEFAULT_PORTFOLIO, date.today().isoformat())
+                st.rerun()
+    
+    # Browse existing snapshots only; new ones are saved explicitly below
+    snapshot_dates = list_snapshot_dates(conn, client_id)
+    if st.session_state.get('snapshot_date') not in snapshot_dates:
+        st.session_state.pop('snapshot_date', None)
+    snapshot_date = st.sidebar.selectbox("Snapshot Date", snapshot_dates, key='snapshot_date')
+    stored_profile = load_client_profile(conn, client_id)
+    stored_portfolio = load_portfolio_snapshot(conn, client_id, snapshot_date)
+    
     # Sidebar for user inputs
     st.sidebar.header("👤 Your Profile")
     
-    # User profile inputs
-    age = st.sidebar.slider("Age", 18, 80, 35)
-    risk_tolerance = st.sidebar.selectbox("Risk Tolerance", ["Conservative", "Moderate", "Aggressive"])
-    investment_goal = st.sidebar.selectbox("Primary Goal", 
-                                         ["Retirement", "Wealth Building", "Income Generation", "Education Fund"])
-    current_savings = st.sidebar.number_input("Current Savings ($)", value=50000, step=1000)
-    monthly_income = st.sidebar.number_input("Monthly Income ($)", value=5000, step=500)
-    monthly_expenses = st.sidebar.number_input("Monthly Expenses ($)", value=3500, step=500)
-    monthly_investment = st.sidebar.number_input("Monthly Investment ($)", value=500, step=100)
+    # User profile inputs (keyed per client so switching clients reloads stored values)
+    age = st.sidebar.slider("Age", 18, 80, stored_profile['age'], key=f"age_{client_id}")
+    risk_tolerance = st.sidebar.selectbox("Risk Tolerance", RISK_TOLERANCES,
+                                          index=RISK_TOLERANCES.index(stored_profile['risk_tolerance']),
+                                          key=f"risk_tolerance_{client_id}")
+    investment_goal = st.sidebar.selectbox("Primary Goal", INVESTMENT_GOALS,
+                                           index=INVESTMENT_GOALS.index(stored_profile['investment_goal']),
+                                           key=f"investment_goal_{client_id}")
+    current_savings = st.sidebar.number_input("Current Savings ($)", value=stored_profile['current_savings'], step=1000, key=f"current_savings_{client_id}")
+    monthly_income = st.sidebar.number_input("Monthly Income ($)", value=stored_profile['monthly_income'], step=500, key=f"monthly_income_{client_id}")
+    monthly_expenses = st.sidebar.number_input("Monthly Expenses ($)", value=stored_profile['monthly_expenses'], step=500, key=f"monthly_expenses_{client_id}")
+    monthly_investment = st.sidebar.number_input("Monthly Investment ($)", value=stored_profile['monthly_investment'], step=100, key=f"monthly_investment_{client_id}")
     
     # Portfolio inputs
     st.sidebar.header("💼 Current Portfolio")
     portfolio_data = {}
-    portfolio_data['Stocks'] = st.sidebar.number_input("Stocks ($)", value=st.session_state.portfolio_data['Stocks'])
-    portfolio_data['Bonds'] = st.sidebar.number_input("Bonds ($)", value=st.session_state.portfolio_data['Bonds'])
-    portfolio_data['Real Estate'] = st.sidebar.number_input("Real Estate ($)", value=st.session_state.portfolio_data['Real Estate'])
-    portfolio_data['Cash'] = st.sidebar.number_input("Cash ($)", value=st.session_state.portfolio_data['Cash'])
-    portfolio_data['Commodities'] = st.sidebar.number_input("Commodities ($)", value=st.session_state.portfolio_data['Commodities'])
-    portfolio_data['Crypto'] = st.sidebar.number_input("Crypto ($)", value=st.session_state.portfolio_data['Crypto'])
+    for asset in ASSET_CLASSES:
+        portfolio_data[asset] = st.sidebar.number_input(f"{asset} ($)", value=stored_portfolio[asset],
+                                                        key=f"{asset}_{client_id}_{snapshot_date}")
+    
+    # Holding edits stay a draft until saved to a snapshot date
+    if portfolio_data != stored_portfolio:
+        st.sidebar.caption(f"✏️ Unsaved changes to the {snapshot_date} holdings")
     
-    # Update session state
-    st.session_state.portfolio_data = portfolio_data
+    with st.sidebar.expander("📅 Save Snapshot"):
+        new_snapshot_date = st.date_input("Snapshot Date", value=date.today(), key=f"new_snapshot_date_{client_id}")
+        if st.button("Save Snapshot"):
+            save_portfolio_snapshot(conn, client_id, new_snapshot_date.isoformat(), portfolio_data)
+            st.session_state.pending_snapshot_date = new_snapshot_date.isoformat()
+            st.rerun()
+        if st.button(f"Update {snapshot_date} Snapshot", disabled=portfolio_data == stored_portfolio):
+            save_portfolio_snapshot(conn, client_id, snapshot_date, portfolio_data)
+            st.rerun()
     
-    # Calculate metrics
-    metrics = calculate_portfolio_metrics(portfolio_data)
-    savings_rate = ((monthly_income - monthly_expenses) / monthly_income) * 100 if monthly_income > 0 else 0
+    # Persist edits to the client store
+    profile = {
+        'age': age,
+        'risk_tolerance': risk_tolerance,
+        'investment_goal': investment_goal,
+        'current_savings': current_savings,
+        'monthly_income': monthly_income,
+        'monthly_expenses': monthly_expenses,
+        'monthly_investment': monthly_investment
+    }
+    if profile != stored_profile:
+        save_client_profile(conn, client_id, profile)
+    
+    # Calculate metrics (cached per snapshot, profile-based values per client; drafts aren't cached)
+    snapshot_id = get_snapshot_id(conn, client_id, snapshot_date) if portfolio_data == stored_portfolio else None
+    derived = get_derived_values(conn, client_id, snapshot_id, dict(profile, portfolio=portfolio_data),
+                                 DERIVED_DEPENDENCIES, _compute_derived_value, DERIVED_VERSION)
+    metrics = derived['metrics']
+    savings_rate = derived['savings_rate']
     
     # Main dashboard
     tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Portfolio", "🎯 Recommendations", "📈 Analysis", "🔮 Projections", "❓ FAQ"])
@@ -360,7 +463,8 @@ def main():
         # Performance comparison chart
         st.subheader("Performance Comparison")
         
-        # Create dummy performance data
+        # Create dummy performance data (seeded so it stays stable across reruns)
+        np.random.seed(42)
         dates = pd.date_range(end=datetime.now(), periods=12, freq='M')
         performance_data = pd.DataFrame({
             'Date': dates,
@@ -372,12 +476,34 @@ def main():
         fig_line = px.line(performance_data, x='Date', y=['Your Portfolio', 'S&P 500', 'Bond Index'],
                           title='Portfolio Performance vs Benchmarks')
         st.plotly_chart(fig_line, use_container_width=True)
+        
+        # Snapshot history
+        st.subheader("Snapshot History")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            history_df = pd.DataFrame(load_snapshot_history(conn, client_id), columns=['Date', 'Total Value'])
+            history_df['Date'] = pd.to_datetime(history_df['Date'])
+            fig_history = px.line(history_df, x='Date', y='Total Value', markers=True,
+                                  title=f"{client_names[client_id]} - Portfolio Value Over Time")
+            st.plotly_chart(fig_history, use_container_width=True)
+        
+        with col2:
+            st.markdown(f"**Changes recorded on {snapshot_date}:**")
+            changes_df = pd.DataFrame(load_snapshot_changes(conn, client_id, snapshot_date),
+                                      columns=['Asset', 'Previous Value', 'New Value'])
+            if changes_df.empty:
+                st.info("No holdings changed since the previous snapshot.")
+            else:
+                changes_df['Previous Value'] = changes_df['Previous Value'].apply(lambda x: f"${x:,.0f}")
+                changes_df['New Value'] = changes_df['New Value'].apply(lambda x: f"${x:,.0f}")
+                st.dataframe(changes_df, use_container_width=True, hide_index=True)
     
     with tab2:
         st.header("Investment Recommendations")
         
         # Get recommendations
-        recommendations = get_investment_recommendations(risk_tolerance, age, investment_goal)
+        recommendations = derived['recommendations']
         
         st.markdown(f"**Based on your {risk_tolerance.lower()} risk profile and {investment_goal.lower()} goal:**")
         
@@ -514,9 +640,7 @@ def main():
         
         # Retirement planning
         years_to_retirement = max(65 - age, 0)
-        retirement_projection = calculate_retirement_projection(
-            current_savings, monthly_investment, years_to_retirement
-        )
+        retirement_projection = derived['retirement_projection']
         
         col1, col2 = st.columns(2)
         
@@ -526,8 +650,7 @@ def main():
             st.metric("Years to Retirement", f"{years_to_retirement} years")
             
             # Retirement needs (25x annual expenses rule)
-            annual_expenses = monthly_expenses * 12
-            retirement_needs = annual_expenses * 25
+            retirement_needs = derived['retirement_needs']
             st.metric("Estimated Retirement Needs", f"${retirement_needs:,.0f}")
             
             if retirement_projection >= retirement_needs:
@@ -551,11 +674,7 @@ def main():
             
             # Create projection chart
             years = list(range(0, years_to_retirement + 1))
-            projected_values = []
-            
-            for year in years:
-                value = calculate_retirement_projection(current_savings, monthly_investment, year)
-                projected_values.append(value)
+            projected_values = derived['projection_series']
             
             projection_df = pd.DataFrame({
                 'Year': [datetime.now().year + year for year in years],
@@ -571,11 +690,7 @@ def main():
         # Scenario analysis
         st.subheader("Scenario Analysis")
         
-        scenarios = {
-            'Conservative (5% return)': calculate_retirement_projection(current_savings, monthly_investment, years_to_retirement, 0.05),
-            'Moderate (7% return)': calculate_retirement_projection(current_savings, monthly_investment, years_to_retirement, 0.07),
-            'Aggressive (9% return)': calculate_retirement_projection(current_savings, monthly_investment, years_to_retirement, 0.09)
-        }
+        scenarios = derived['scenarios']
         
         scenario_df = pd.DataFrame(list(scenarios.items()), columns=['Scenario', 'Projected Value'])
         scenario_df['Projected Value'] = scenario_df['Projected Value'].apply(lambda x: f"${x:,.0f}")
@@ -663,5 +778,9 @@ def main():
             fig_cat.update_layout(height=300)
             st.plotly_chart(fig_cat, use_container_width=True)
 
+def main():
+    with closing(get_connection(DB_PATH)) as conn:
+        render_dashboard(conn)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
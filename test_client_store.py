@@ -0,0 +1,102 @@
+import pytest
+
+from client_store import (DEFAULT_PROFILE, get_connection, create_client, save_portfolio_snapshot,
+                          load_portfolio_snapshot, load_snapshot_changes, load_snapshot_history,
+                          list_snapshot_dates, get_snapshot_id, get_derived_values)
+
+PORTFOLIO = {'Stocks': 100, 'Bonds': 50, 'Real Estate': 0, 'Cash': 10, 'Commodities': 0, 'Crypto': 0}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = get_connection(str(tmp_path / 'store.db'))
+    yield conn
+    conn.close()
+
+
+def test_resolves_holdings_between_snapshots(conn):
+    client_id = create_client(conn, 'A', DEFAULT_PROFILE, PORTFOLIO, '2024-01-01')
+    save_portfolio_snapshot(conn, client_id, '2024-06-01', dict(PORTFOLIO, Stocks=200))
+
+    assert load_portfolio_snapshot(conn, client_id, '2023-12-31') == dict.fromkeys(PORTFOLIO, 0)
+    assert load_portfolio_snapshot(conn, client_id, '2024-03-01') == PORTFOLIO
+    assert load_portfolio_snapshot(conn, client_id, '2025-01-01') == dict(PORTFOLIO, Stocks=200)
+    assert load_snapshot_changes(conn, client_id, '2024-06-01') == [('Stocks', 100, 200)]
+    assert load_snapshot_history(conn, client_id) == [('2024-01-01', 160), ('2024-06-01', 260)]
+
+
+def test_backfilled_snapshot_flows_into_later_snapshot(conn):
+    client_id = create_client(conn, 'A', DEFAULT_PROFILE, PORTFOLIO, '2024-06-01')
+    save_portfolio_snapshot(conn, client_id, '2024-01-01', dict(PORTFOLIO, Bonds=20, Crypto=5))
+
+    assert list_snapshot_dates(conn, client_id) == ['2024-06-01', '2024-01-01']
+    assert load_portfolio_snapshot(conn, client_id, '2024-06-01') == PORTFOLIO
+    # Holdings that already matched the backfilled values are no longer recorded as changes
+    assert sorted(load_snapshot_changes(conn, client_id, '2024-06-01')) == [('Bonds', 20, 50), ('Crypto', 5, 0)]
+    assert load_snapshot_history(conn, client_id) == [('2024-01-01', 135), ('2024-06-01', 160)]
+
+
+def test_editing_old_snapshot_keeps_later_snapshot_unchanged(conn):
+    client_id = create_client(conn, 'A', DEFAULT_PROFILE, PORTFOLIO, '2024-01-01')
+    save_portfolio_snapshot(conn, client_id, '2024-06-01', dict(PORTFOLIO, Bonds=1))
+    save_portfolio_snapshot(conn, client_id, '2024-01-01', dict(PORTFOLIO, Stocks=1))
+
+    assert load_portfolio_snapshot(conn, client_id, '2024-01-01') == dict(PORTFOLIO, Stocks=1)
+    assert load_portfolio_snapshot(conn, client_id, '2024-06-01') == dict(PORTFOLIO, Bonds=1)
+    assert sorted(load_snapshot_changes(conn, client_id, '2024-06-01')) == [('Bonds', 50, 1), ('Stocks', 1, 100)]
+    assert load_snapshot_history(conn, client_id) == [('2024-01-01', 61), ('2024-06-01', 111)]
+
+
+def test_holding_changed_back_removes_change_row(conn):
+    client_id = create_client(conn, 'A', DEFAULT_PROFILE, PORTFOLIO, '2024-01-01')
+    save_portfolio_snapshot(conn, client_id, '2024-06-01', dict(PORTFOLIO, Stocks=200))
+    save_portfolio_snapshot(conn, client_id, '2024-06-01', PORTFOLIO)
+
+    assert load_snapshot_changes(conn, client_id, '2024-06-01') == []
+    assert load_portfolio_snapshot(conn, client_id, '2024-06-01') == PORTFOLIO
+    assert load_snapshot_history(conn, client_id) == [('2024-01-01', 160), ('2024-06-01', 160)]
+
+
+def test_derived_values_recompute_only_changed_inputs(conn):
+    client_id = create_client(conn, 'A', DEFAULT_PROFILE, PORTFOLIO, '2024-01-01')
+    save_portfolio_snapshot(conn, client_id, '2024-06-01', dict(PORTFOLIO, Stocks=200))
+    dependencies = {
+        'total': ['portfolio'],
+        'savings': ['monthly_income', 'monthly_expenses'],
+        'needs': ['monthly_expenses']
+    }
+    calls = []
+
+    def compute(name, inputs):
+        calls.append(name)
+        if name == 'total':
+            return sum(inputs['portfolio'].values())
+        elif name == 'savings':
+            return inputs['monthly_income'] - inputs['monthly_expenses']
+        return inputs['monthly_expenses'] * 12
+
+    def derive(snapshot_date, version=1, **changes):
+        inputs = dict(DEFAULT_PROFILE, portfolio=load_portfolio_snapshot(conn, client_id, snapshot_date), **changes)
+        return get_derived_values(conn, client_id, get_snapshot_id(conn, client_id, snapshot_date),
+                                  inputs, dependencies, compute, version)
+
+    assert derive('2024-01-01') == {'total': 160, 'savings': 1500, 'needs': 42000}
+    assert calls == ['total', 'savings', 'needs']
+
+    calls.clear()
+    assert derive('2024-01-01') == {'total': 160, 'savings': 1500, 'needs': 42000}
+    assert calls == []
+
+    calls.clear()
+    assert derive('2024-01-01', monthly_income=6000)['savings'] == 2500
+    assert calls == ['savings']
+
+    # Profile-based values are shared across snapshots of the same client
+    calls.clear()
+    assert derive('2024-06-01', monthly_income=6000)['total'] == 260
+    assert calls == ['total']
+
+    # A new calculation version invalidates every cached value
+    calls.clear()
+    derive('2024-06-01', version=2, monthly_income=6000)
+    assert calls == ['total', 'savings', 'needs']